@@ -1,12 +1,111 @@
 #!/usr/bin/env python3
+import functools
+import glob
+import itertools
 import os
+import re
 import sys
-from typing import List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 CG2_ROOT = "/sys/fs/cgroup"
 
+# Below this many matching PIDs, status files are read without a thread pool
+_PARALLEL_MIN_PIDS = 64
 
-def list_container_pids_and_names(container_host_pid: int):
+# Matches the "Name:" value or the last (innermost) PID on the "NSpid:" line
+# (horizontal whitespace only, so an empty Name can't swallow the next line)
+_STATUS_RE = re.compile(rb"^(?:Name:[ \t]*(.*)|NSpid:[^\n]*[ \t](\d+))$", re.M)
+
+
+def _read_at(proc_fd: int, rel_path: str, size: int) -> bytes:
+    """
+    Read up to 'size' bytes of 'rel_path' (relative to the open /proc
+    directory 'proc_fd') with a single read().
+    """
+    fd = os.open(rel_path, os.O_RDONLY, dir_fd=proc_fd)
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+def _read_status(rel_path: str, proc_fd: Optional[int] = None, size: int = 8192) -> bytes:
+    """
+    Read a /proc/<pid>/status file, normally with a single read(). The
+    NSpid line comes after Groups:, which grows with supplementary groups,
+    so if the buffer fills before a complete NSpid line, keep reading to EOF.
+    """
+    fd = os.open(rel_path, os.O_RDONLY, dir_fd=proc_fd)
+    try:
+        buf = os.read(fd, size)
+        if len(buf) == size:
+            start = buf.find(b"\nNSpid:")
+            if start == -1 or buf.find(b"\n", start + 1) == -1:
+                chunks = [buf]
+                while True:
+                    chunk = os.read(fd, size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                buf = b"".join(chunks)
+        return buf
+    finally:
+        os.close(fd)
+
+
+def _read_status_fields(pid: str, proc_fd: int) -> Optional[Tuple[int, str]]:
+    """
+    Return (container_pid, name) parsed from /proc/<pid>/status, or None if
+    the process raced away or has no NSpid line.
+    """
+    try:
+        # Read Name and container-visible PID from /proc/<pid>/status, in a
+        # single read() unless the file is unusually large
+        name = None
+        cpid = None
+        buf = _read_status(f"{pid}/status", proc_fd)
+        # One C-level regex pass instead of a Python loop over ~50 lines
+        for mo in _STATUS_RE.finditer(buf):
+            if mo.group(1) is not None:
+                # Process name
+                name = mo.group(1).strip().decode("utf-8", errors="ignore")
+            else:
+                # NSpid: last number is the PID as seen in this namespace
+                cpid = int(mo.group(2))  # same-namespace ⇒ last element is container PID
+            # We can break early once we've seen both lines
+            if name is not None and cpid is not None:
+                break
+
+        if name is None:
+            # Fallback if /proc/<pid>/status didn't have Name (very rare)
+            name = _read_at(proc_fd, f"{pid}/comm", 64).strip().decode("utf-8", errors="ignore")
+    except OSError:
+        # Process may have exited, be inaccessible, or otherwise raced; skip
+        return None
+
+    if cpid is None:
+        # If NSpid is missing (uncommon), skip; we only want container-view PIDs
+        return None
+    return cpid, name
+
+
+def _read_comm_fields(pid: str, proc_fd: int) -> Optional[Tuple[int, str]]:
+    """
+    Return (pid, name) using only /proc/<pid>/comm. Only valid when the
+    process shares our own PID namespace, where the host PID is the
+    namespace PID.
+    """
+    try:
+        buf = _read_at(proc_fd, f"{pid}/comm", 64)
+    except OSError:
+        # Process may have exited, be inaccessible, or otherwise raced; skip
+        return None
+    return int(pid), buf.strip().decode("utf-8", errors="ignore")
+
+
+def list_container_pids_and_names(container_host_pid: int, strict_nspid: bool = False):
     """
     Return a list of (container_pid, name) for every process that shares
     the PID namespace of `container_host_pid`.
@@ -17,6 +116,10 @@ def list_container_pids_and_names(container_host_pid: int):
     ----------
     container_host_pid : int
         A host PID for any process inside the target container (e.g. its init).
+    strict_nspid : bool
+        Always read /proc/<pid>/status for NSpid. By default, when the target
+        namespace is our own, the host PID is used directly and only
+        /proc/<pid>/comm is read.
 
     Returns
     -------
@@ -33,64 +136,64 @@ def list_container_pids_and_names(container_host_pid: int):
     proc_base = "/proc"
     ref = str(container_host_pid)
 
-    # Verify the reference PID exists and capture its PID-namespace handle
+    # Resolve every per-PID path relative to one open /proc directory so the
+    # kernel doesn't re-walk "/proc" for each lookup
+    proc_fd = os.open(proc_base, os.O_RDONLY | os.O_DIRECTORY)
     try:
-        ref_ns = os.readlink(f"{proc_base}/{ref}/ns/pid")  # e.g., "pid:[4026532xxx]"
-    except FileNotFoundError:
-        raise ValueError(f"Host PID {container_host_pid} does not exist in /proc")
-    except PermissionError as e:
-        raise PermissionError(f"Insufficient permissions to read /proc/{ref}/ns/pid: {e}")
-
-    results = []
-
-    for entry in os.listdir(proc_base):
-        if not entry.isdigit():
-            continue
-        pid_path = f"{proc_base}/{entry}"
+        # Verify the reference PID exists and capture its PID-namespace inode
         try:
-            # Match processes that are in the same PID namespace
-            if os.readlink(f"{pid_path}/ns/pid") != ref_ns:
-                continue
-
-            # Read Name and container-visible PID from /proc/<pid>/status
-            name = None
-            cpid = None
-            with open(f"{pid_path}/status", "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    # Process name
-                    if line.startswith("Name:"):
-                        name = line.split(":", 1)[1].strip()
-                    # NSpid: last number is the PID as seen in this namespace
-                    elif line.startswith("NSpid:"):
-                        parts = line.split()[1:]
-                        if parts:
-                            cpid = int(parts[-1])  # same-namespace ⇒ last element is container PID
-                        # We can break early once we've seen both lines
-                        if name is not None and cpid is not None:
-                            break
-
-            if name is None:
-                # Fallback if /proc/<pid>/status didn't have Name (very rare)
-                with open(f"{pid_path}/comm", "r", encoding="utf-8", errors="ignore") as f:
-                    name = f.read().strip()
-
-            if cpid is None:
-                # If NSpid is missing (uncommon), skip; we only want container-view PIDs
-                continue
-
-            results.append((cpid, name))
-
+            ref_ino = os.stat(f"{ref}/ns/pid", dir_fd=proc_fd).st_ino  # "pid:[<ino>]"
         except FileNotFoundError:
-            # Process may have exited during iteration; skip
-            continue
-        except PermissionError:
-            # Lacking permission for some processes; skip them
-            continue
-        except OSError:
-            # Other transient /proc races; skip
-            continue
-
-    results.sort(key=lambda t: t[0])
+            raise ValueError(f"Host PID {container_host_pid} does not exist in /proc")
+        except PermissionError as e:
+            raise PermissionError(f"Insufficient permissions to read /proc/{ref}/ns/pid: {e}")
+
+        _stat = os.stat
+
+        reader = _read_status_fields
+        if not strict_nspid:
+            try:
+                # Same namespace as us ⇒ host PID == namespace PID, skip NSpid parsing
+                if _stat("self/ns/pid", dir_fd=proc_fd).st_ino == ref_ino:
+                    reader = _read_comm_fields
+            except OSError:
+                pass
+
+        pids = []
+        add_pid = pids.append
+        with os.scandir(proc_base) as it:
+            for entry in it:
+                pid = entry.name
+                # Non-PID entries (cpuinfo, self, ...) start with a letter
+                if not pid[0].isdigit() or not pid.isdigit():
+                    continue
+                try:
+                    # Match processes that are in the same PID namespace
+                    if _stat(f"{pid}/ns/pid", dir_fd=proc_fd).st_ino != ref_ino:
+                        continue
+                except OSError:
+                    # Exited, inaccessible, or other transient /proc races; skip
+                    continue
+                add_pid(pid)
+
+        fds = itertools.repeat(proc_fd, len(pids))
+        if len(pids) < _PARALLEL_MIN_PIDS:
+            # Typical containers hold a handful of processes; spinning up a pool
+            # costs more than reading them directly
+            results = [res for res in map(reader, pids, fds) if res is not None]
+        else:
+            # procfs reads are syscall-bound and release the GIL, so overlap them.
+            # (io_uring wouldn't do better here: procfs has no non-blocking
+            # read path, so the ring would punt every read to io-wq threads.)
+            workers = min(32, (os.cpu_count() or 1) * 4)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = [res for res in pool.map(reader, pids, fds) if res is not None]
+    finally:
+        os.close(proc_fd)
+
+    # Container PIDs are unique within a namespace, so plain tuple ordering
+    # sorts by PID without a per-item key function
+    results.sort()
     return results
 
 
@@ -120,46 +223,119 @@ def _read_cg2_path_from_proc_cgroup(pid: str) -> Optional[str]:
     return None
 
 
-def container_cg2_path(container_id: str) -> str:
+@functools.lru_cache(maxsize=1)
+def _cached_cg2_scan(generation: int) -> Tuple[Tuple[str, str], ...]:
     """
-    Given a Docker container ID (full or short), return its cgroup v2 path
-    (as shown in /proc/<pid>/cgroup), e.g. '/system.slice/docker-<id>.scope'
-    or '/docker/<id>' depending on host setup (systemd vs non-systemd, rootless, etc).
+    One pass over /proc/*/cgroup, returning unique (cgpath, cgpath.lower())
+    pairs, shortest path first. 'generation' is only a cache key; see
+    _scan_cg2_paths.
+    """
+    seen = {}
+    with os.scandir("/proc") as it:
+        for entry in it:
+            name = entry.name
+            if not name[0].isdigit() or not name.isdigit():
+                continue
+            cgpath = _read_cg2_path_from_proc_cgroup(name)
+            if cgpath and cgpath not in seen:
+                seen[cgpath] = cgpath.lower()
+    return tuple(sorted(seen.items(), key=lambda kv: len(kv[0])))
 
-    Strategy (no docker CLI):
-      1) Scan /proc/*/cgroup for a v2 entry (0::/...) that contains the container ID.
-      2) Validate that the resulting path exists under /sys/fs/cgroup.
-      3) If multiple matches appear, pick the shortest path (most specific).
+
+def _scan_cg2_paths() -> Tuple[Tuple[str, str], ...]:
     """
-    _ensure_cgroup_v2()
-    cid = container_id.lower()
+    Return the cgroup v2 paths in use by any process, reusing the previous
+    /proc scan if it happened within the current second.
+    """
+    return _cached_cg2_scan(int(time.monotonic()))
 
-    candidates = []
 
-    for name in os.listdir("/proc"):
-        if not name.isdigit():
-            continue
-        cgpath = _read_cg2_path_from_proc_cgroup(name)
-        if not cgpath:
+# Where Docker usually places a container's cgroup, relative to CG2_ROOT
+_CG2_PROBE_PATTERNS = (
+    "system.slice/docker-{cid}.scope",             # systemd driver
+    "docker/{cid}",                                # cgroupfs driver
+    "user.slice/*/*/docker-{cid}.scope",           # rootless (user@<uid>.service)
+    "user.slice/*/*/*/docker-{cid}.scope",
+)
+
+
+def _probe_cg2_path(cid: str) -> Optional[str]:
+    """
+    Look for the container's cgroup at the usual Docker locations without
+    touching /proc. Returns the /proc-style path ('/system.slice/...') or None
+    if there is no unique hit.
+    """
+    full = len(cid) == 64
+    for pattern in _CG2_PROBE_PATTERNS:
+        if full and "*" not in pattern:
+            abs_path = os.path.join(CG2_ROOT, pattern.format(cid=cid))
+            if os.path.isdir(abs_path):
+                return "/" + os.path.relpath(abs_path, CG2_ROOT)
             continue
+        # Short IDs (and rootless layouts) need a wildcard match
+        rel = pattern.format(cid=cid if full else cid + "*")
+        hits = [h for h in glob.glob(os.path.join(CG2_ROOT, rel)) if os.path.isdir(h)]
+        if len(hits) == 1:
+            return "/" + os.path.relpath(hits[0], CG2_ROOT)
+    return None
+
+
+def container_cg2_paths(container_ids: List[str]) -> Dict[str, str]:
+    """
+    Batch form of container_cg2_path: resolve several container IDs against a
+    single /proc scan. IDs that cannot be resolved are omitted from the result.
+    """
+    _ensure_cgroup_v2()
+
+    found: Dict[str, str] = {}
+    pending = []
+    for container_id in container_ids:
+        probed = _probe_cg2_path(container_id.lower())
+        if probed is not None:
+            found[container_id] = probed
+        else:
+            pending.append(container_id)
+    if not pending:
+        return found
+
+    scan = _scan_cg2_paths()
+    for container_id in pending:
+        cid = container_id.lower()
         # Common Docker patterns on cgroup v2:
         #  - .../system.slice/docker-<id>.scope
         #  - .../user.slice/.../docker-<id>.scope  (rootless)
         #  - .../docker/<id>                       (non-systemd cgroupfs driver)
-        if cid in cgpath.lower():
-            # confirm the directory exists under /sys/fs/cgroup
-            abs_path = os.path.join(CG2_ROOT, cgpath.lstrip("/"))
-            if os.path.isdir(abs_path):
-                candidates.append(cgpath)
+        # The scan is ordered by length, so the first validated hit is the
+        # shortest (most specific) match
+        for cgpath, lowered in scan:
+            if cid in lowered:
+                # confirm the directory exists under /sys/fs/cgroup
+                abs_path = os.path.join(CG2_ROOT, cgpath.lstrip("/"))
+                if os.path.isdir(abs_path):
+                    found[container_id] = cgpath
+                    break
+    return found
 
-    if not candidates:
+
+def container_cg2_path(container_id: str) -> str:
+    """
+    Given a Docker container ID (full or short), return its cgroup v2 path
+    (as shown in /proc/<pid>/cgroup), e.g. '/system.slice/docker-<id>.scope'
+    or '/docker/<id>' depending on host setup (systemd vs non-systemd, rootless, etc).
+
+    Strategy (no docker CLI):
+      0) Probe the usual Docker cgroup locations directly; return on a unique hit.
+      1) Otherwise scan /proc/*/cgroup for a v2 entry (0::/...) that contains the container ID.
+         The scan is shared with other lookups made within the same second.
+      2) Validate that the resulting path exists under /sys/fs/cgroup.
+      3) If multiple matches appear, pick the shortest path (most specific).
+    """
+    best = container_cg2_paths([container_id]).get(container_id)
+    if best is None:
         raise FileNotFoundError(
             f"Could not find cgroup v2 path for container id '{container_id}'. "
             "Is it running on this host, and is cgroup v2 enabled?"
         )
-
-    # Prefer the shortest (most specific) match
-    best = min(candidates, key=len)
     return best
 
 
@@ -167,18 +343,23 @@ def _read_pids_from_cgroup_dir(abs_dir: str) -> List[int]:
     """
     Read PIDs from cgroup.procs in 'abs_dir'. Return [] if missing/racing.
     """
-    pids: List[int] = []
     procs_file = os.path.join(abs_dir, "cgroup.procs")
     try:
-        with open(procs_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line.isdigit():
-                    pids.append(int(line))
+        fd = os.open(procs_file, os.O_RDONLY)
     except FileNotFoundError:
         # Directory may have disappeared if the container exited
-        pass
-    return pids
+        return []
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    # cgroup.procs is one decimal PID per line
+    return [int(x) for x in b"".join(chunks).split()]
 
 
 def _recursive_pids(abs_root: str) -> List[int]:
@@ -187,9 +368,20 @@ def _recursive_pids(abs_root: str) -> List[int]:
     cgroup v2 lists only tasks in the current cgroup in cgroup.procs, so we walk.
     """
     all_pids: List[int] = []
-    for cur, dirs, files in os.walk(abs_root):
+    stack = [abs_root]
+    while stack:
+        cur = stack.pop()
         all_pids.extend(_read_pids_from_cgroup_dir(cur))
-    # dedupe and sort for stable output
+        try:
+            with os.scandir(cur) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            # Sub-cgroup removed or unreadable; os.walk skipped these too
+            continue
+    # cgroup.procs may repeat a PID, and a process can migrate between
+    # sub-cgroups mid-walk; dedupe and sort for stable output
     return sorted(set(all_pids))
 
 
@@ -215,24 +407,31 @@ def host_pid_of_container_init(container_id: str) -> Optional[int]:
     Find the host PID whose NSpid line says the innermost namespace PID is 1.
     Returns None if not found (e.g., very short-lived PID1).
     """
+    # host_pids() is sorted ascending, and the container's init almost always
+    # has the lowest host PID in its cgroup, so this usually stops at once
     for pid in host_pids(container_id):
         try:
-            with open(f"/proc/{pid}/status", "r") as f:
-                for line in f:
-                    if line.startswith("NSpid:"):
-                        # The last number is PID in the deepest PID namespace
-                        innermost = line.split()[-1]
-                        if innermost == "1":
-                            return pid
-        except FileNotFoundError:
+            # Usually one read(); _read_status keeps going when a long Groups:
+            # line pushes NSpid past the first buffer
+            buf = _read_status(f"/proc/{pid}/status")
+        except OSError:
+            # Process raced away
             continue
+        for line in buf.splitlines():
+            if line.startswith(b"NSpid:"):
+                # The last number is PID in the deepest PID namespace
+                if line.split()[-1] == b"1":
+                    return pid
+                break
     return None
 
-# Example usage (run as root or with sufficient /proc,/sys access):
-cid = sys.argv[1]
-print("cgroup v2 path:", container_cg2_path(cid))
-print("host PIDs:", host_pids(cid))
-print("host PID of container init (PID 1):", host_pid_of_container_init(cid))
 
-print(list_container_pids_and_names(host_pid_of_container_init(cid)))
+if __name__ == "__main__":
+    # Example usage (run as root or with sufficient /proc,/sys access):
+    cid = sys.argv[1]
+    print("cgroup v2 path:", container_cg2_path(cid))
+    print("host PIDs:", host_pids(cid))
+    init_pid = host_pid_of_container_init(cid)
+    print("host PID of container init (PID 1):", init_pid)
 
+    print(list_container_pids_and_names(init_pid))
@@ -11,14 +11,207 @@ import string
 import yaml
 import asyncio
 import traceback
+import selectors
 import socket
 import sys
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Resolved once at import so each request skips the PATH search
+_PY3 = shutil.which("python3") or "/usr/bin/python3"
+_GUEST_CMD = [_PY3, "/igloo_static/guesthopper/guest_cmd.py", "cat", "/etc/passwd"]
+
+# Static part of every reply; only Content-Length and the body vary
+_RESP_PREFIX = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: "
+)
+
+# Sent for anything other than a GET of / or /status
+_RESP_404 = (
+    b"HTTP/1.1 404 Not Found\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+# Sent when the request can't be served: too many are already waiting for
+# a handler, or reading from the target system failed
+_RESP_503 = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+# Sent when reading from the target system timed out
+_RESP_504 = (
+    b"HTTP/1.1 504 Gateway Timeout\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+# Upper bound on concurrently handled HTTP clients
+_MAX_HANDLERS = 8
+
+# Ready replies allowed to wait for or occupy a handler. Requests still
+# waiting on a snapshot don't count; this only fills if the pool is stuck
+# writing to slow clients.
+_MAX_QUEUED = 256
+
+# Connections per accept loop still sending their headers
+_MAX_PENDING = 64
+
+# How long a client gets to send its request headers
+_HEADER_TIMEOUT = 5
+
+# Largest request header block we are willing to buffer
+_MAX_HEADER_BYTES = 65536
+
+# How long a dostuff() result is reused for subsequent requests
+_RESULT_TTL = 0.5
+
+# How long the collector waits for more requests to join a batch
+_BATCH_WINDOW = 0.05
+
+# How long a client waits for the collector before giving up
+_RESULT_TIMEOUT = 30
+
+# How long guest_cmd.py may run before it is killed; kept below
+# _RESULT_TIMEOUT so a hung command can't wedge the single collector
+_COLLECT_TIMEOUT = 20
+
+# Set once a listener has been started in this process; a second plugin
+# instance (or re-import) must not race the first for port 9999
+_STARTED = False
+_STARTED_LOCK = threading.Lock()
+
+# Process-wide snapshot collector, created by the first plugin instance
+_COLLECTOR = None
+
+
+# Removed unused args; now returns text so the HTTP handler can reply with it
+def _collect() -> str:
+    lines = ["okay reading from target system"]
+    # TimeoutExpired (child already killed) propagates to the waiting
+    # futures via _Collector._loop and is not cached
+    r = subprocess.run(_GUEST_CMD, capture_output=True, check=False, timeout=_COLLECT_TIMEOUT)
+
+    if r.stdout:
+        lines.append(r.stdout.decode("utf-8", errors="replace"))
+    if r.stderr:
+        lines.append(r.stderr.decode("utf-8", errors="replace"))
+
+    out = "\n".join(lines)
+    print(out, flush=True)  # still log to stdout as before
+    return out
+
+
+class _Collector:
+    """
+    Short-lived cache of the last snapshot plus a single collector thread
+    that runs the subprocess once per batch of queued requests (including
+    any that queue up while it runs) and fans the result out to every
+    waiting Future.
+    """
+
+    def __init__(self):
+        # (timestamp, text) of the last successful collection
+        self._cache = (0.0, "")
+        self._cache_lock = threading.Lock()
+        self._work_q = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._loop,
+            name="InstrospectionCollector",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def request(self) -> Future:
+        """
+        Return a Future for a target-system snapshot: already resolved if
+        the cached result is younger than _RESULT_TTL, otherwise queued for
+        the collector's next batch.
+        """
+        fut = Future()
+        with self._cache_lock:
+            ts, cached = self._cache
+            if time.monotonic() - ts < _RESULT_TTL:
+                fut.set_result(cached)
+                return fut
+        self._work_q.put(fut)
+        return fut
+
+    def _loop(self):
+        while True:
+            batch = [self._work_q.get()]
+            # Let a burst of requests pile up so they share one subprocess
+            deadline = time.monotonic() + _BATCH_WINDOW
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._work_q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                out = _collect()
+            except Exception as e:
+                for fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            with self._cache_lock:
+                self._cache = (time.monotonic(), out)
+            # Requests that arrived while _collect() ran are answered with
+            # this same fresh result rather than triggering another run
+            while True:
+                try:
+                    batch.append(self._work_q.get_nowait())
+                except queue.Empty:
+                    break
+            for fut in batch:
+                fut.set_result(out)
+
+
+def _get_collector() -> _Collector:
+    global _COLLECTOR
+    with _STARTED_LOCK:
+        if _COLLECTOR is None:
+            _COLLECTOR = _Collector()
+        return _COLLECTOR
+
 
 class Instrospection(Plugin):
     def __init__(self):
         print("Introspection plugin initialized.")
         sys.stdout.flush()
 
+        # The snapshot cache and collector are shared by every instance, so
+        # dostuff() works on all of them; only the first starts a listener
+        self._collector = _get_collector()
+
+        global _STARTED
+        with _STARTED_LOCK:
+            if _STARTED:
+                print("[Instrospection] listener already running; not starting another", flush=True)
+                return
+            _STARTED = True
+
+        # Reused handler threads instead of one fresh thread per connection.
+        # Only replies whose snapshot is ready are submitted, and at most
+        # _MAX_QUEUED of them at a time, so idle or waiting sockets never
+        # hold a worker.
+        self._handlers = ThreadPoolExecutor(
+            max_workers=_MAX_HANDLERS, thread_name_prefix="InstrospectionHTTP"
+        )
+        self._queued = threading.BoundedSemaphore(_MAX_QUEUED)
+
         # 1) Start a thread on __init__ that runs a TCP listener
         self._server_thread = threading.Thread(
             target=self._start_tcp_listener,
@@ -32,63 +225,163 @@ class Instrospection(Plugin):
         host = "0.0.0.0"
         port = 9999
 
+        # One socket, SO_REUSEADDR only: a second process binding port 9999
+        # must fail rather than silently share our connections
         srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         srv.bind((host, port))
-        srv.listen(5)
+        # A deep backlog so a burst of SYNs is queued by the kernel instead of
+        # being dropped and retransmitted a second later
+        srv.listen(socket.SOMAXCONN)
+        # The accept loop multiplexes the listener and its clients' header
+        # reads with a selector, so nothing may block
+        srv.setblocking(False)
         print(f"[Instrospection] TCP listener started on {host}:{port}", flush=True)
 
+        self._accept_loop(srv)
+
+    def _accept_loop(self, srv: socket.socket):
+        sel = selectors.DefaultSelector()
+        sel.register(srv, selectors.EVENT_READ)
+        # conn -> (deadline, addr, header bytes so far)
+        pending = {}
+
         while True:
-            conn, addr = srv.accept()
-            # Handle each client in its own tiny handler thread
-            threading.Thread(
-                target=self._handle_client, args=(conn, addr), daemon=True
-            ).start()
-
-    def _handle_client(self, conn: socket.socket, addr):
-        conn.settimeout(10)
-        # Read until end of HTTP headers (very small/for demo)
-        data = b""
-        while True:
-            chunk = conn.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if b"\r\n\r\n" in data:
-                break
-
-        # 3) On any request, call dostuff()
-        result = self.dostuff()
+            timeout = None
+            if pending:
+                soonest = min(deadline for deadline, _, _ in pending.values())
+                timeout = max(0.0, soonest - time.monotonic())
+
+            for key, _ in sel.select(timeout):
+                if key.fileobj is srv:
+                    try:
+                        conn, addr = srv.accept()
+                    except (BlockingIOError, InterruptedError):
+                        # Spurious wakeup; the client went away or was reset
+                        continue
+                    if len(pending) >= _MAX_PENDING:
+                        conn.close()
+                        continue
+                    conn.setblocking(False)
+                    pending[conn] = (time.monotonic() + _HEADER_TIMEOUT, addr, bytearray())
+                    sel.register(conn, selectors.EVENT_READ)
+                    continue
+
+                conn = key.fileobj
+                _, addr, buf = pending[conn]
+                try:
+                    chunk = conn.recv(4096)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    chunk = None
+                if chunk is None:
+                    sel.unregister(conn)
+                    del pending[conn]
+                    conn.close()
+                    continue
+
+                # Search only the newly received bytes plus the 3 that could
+                # start a terminator
+                start = max(0, len(buf) - 3)
+                buf.extend(chunk)
+                if (chunk and buf.find(b"\r\n\r\n", start) == -1
+                        and len(buf) < _MAX_HEADER_BYTES):
+                    continue
+
+                sel.unregister(conn)
+                del pending[conn]
+                self._dispatch(conn, addr, buf)
+
+            # Drop clients that never finished sending their headers
+            now = time.monotonic()
+            for conn in [c for c, (deadline, _, _) in pending.items() if deadline <= now]:
+                sel.unregister(conn)
+                del pending[conn]
+                conn.close()
+
+    def _dispatch(self, conn: socket.socket, addr, buf: bytearray):
+        # Only GET / and GET /status are worth a subprocess run; probes and
+        # other methods get a static 404 straight from the accept loop
+        request_line = bytes(buf.split(b"\r\n", 1)[0])
+        if not request_line.startswith((b"GET / ", b"GET /status ")):
+            self._send_static(conn, _RESP_404)
+            return
+
+        # 3) On a valid request, ask for a snapshot. Waiting for it costs no
+        # handler thread: the reply is scheduled once the Future resolves,
+        # and a whole batch of waiters shares one collection.
+        self._collector.request().add_done_callback(
+            lambda fut: self._schedule_reply(conn, addr, fut)
+        )
+
+    def _schedule_reply(self, conn: socket.socket, addr, fut: Future):
+        # Runs on the accept loop or the collector thread, so it must not
+        # block. Only shed when the handler pool really is backed up.
+        if not self._queued.acquire(blocking=False):
+            self._send_static(conn, _RESP_503)
+            return
+        self._handlers.submit(self._serve_client, conn, addr, fut)
+
+    @staticmethod
+    def _send_static(conn: socket.socket, response: bytes):
+        # Short static replies fit in the socket buffer; never wait on them
+        try:
+            conn.setblocking(False)
+            conn.send(response)
+        except OSError:
+            pass
+        conn.close()
+
+    def _serve_client(self, conn: socket.socket, addr, fut: Future):
+        try:
+            conn.setblocking(True)
+            conn.settimeout(10)
+            self._handle_client(conn, fut)
+        except OSError as e:
+            print(f"[Instrospection] client {addr} error: {e}", flush=True)
+        finally:
+            conn.close()
+            self._queued.release()
+
+    def _handle_client(self, conn: socket.socket, fut: Future):
+        # Failures get a static error status so pollers can tell them apart
+        # from data
+        try:
+            result = fut.result()
+        except subprocess.TimeoutExpired:
+            conn.sendall(_RESP_504)
+            return
+        except Exception as e:
+            print(f"[Instrospection] reading target system failed: {e!r}", flush=True)
+            conn.sendall(_RESP_503)
+            return
+
         if result is None:
             result = "OK"
         body_bytes = result.encode("utf-8", errors="replace")
 
-        response = (
-            b"HTTP/1.1 200 OK\r\n"
-            b"Content-Type: text/plain; charset=utf-8\r\n"
-            + f"Content-Length: {len(body_bytes)}\r\n".encode()
-            + b"Connection: close\r\n"
-            b"\r\n"
-            + body_bytes
-        )
-        conn.sendall(response)
+        self._send(conn, _RESP_PREFIX, b"%d\r\n\r\n" % len(body_bytes), body_bytes)
 
-    # Removed unused args; now returns text so the HTTP handler can reply with it
-    def dostuff(self) -> str:
-        lines = ["okay reading from target system"]
-        proc = subprocess.Popen(
-            ["python3", "/igloo_static/guesthopper/guest_cmd.py", "cat", "/etc/passwd"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        stdout, stderr = proc.communicate()
+    @staticmethod
+    def _send(conn: socket.socket, *parts: bytes):
+        """
+        Write all parts with scatter-gather sendmsg(), falling back to
+        sendall() for whatever a short write leaves over.
+        """
+        sent = conn.sendmsg(parts)
+        total = sum(len(p) for p in parts)
+        if sent < total:
+            conn.sendall(b"".join(parts)[sent:])
 
-        if stdout:
-            lines.append(stdout)
-        if stderr:
-            lines.append(stderr)
+    def dostuff(self) -> str:
+        """
+        Return the target-system snapshot, reusing a result produced within
+        the last _RESULT_TTL seconds. Otherwise queue a request for the
+        collector thread and wait for the batch it joins.
 
-        out = "\n".join(lines)
-        print(out, flush=True)  # still log to stdout as before
-        return out
+        Raises concurrent.futures.TimeoutError if the collector doesn't answer
+        within _RESULT_TIMEOUT, subprocess.TimeoutExpired if guest_cmd.py was
+        killed after _COLLECT_TIMEOUT, or whatever else the collection raised.
+        """
+        return self._collector.request().result(timeout=_RESULT_TIMEOUT)